@@ -0,0 +1,45 @@
+"""Per-tick growth kernel, compiled with Numba when it is installed."""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True)
+    def grow_kernel(cells, due, period, now):
+        """Returns the (row, col) of every growing cell that advances this tick.
+        Cells that are due get rescheduled *period* ticks from *now* in place.
+
+        :param cells :(ndarray[intp]) The (row, col) of the growing cells
+        :param due :(ndarray[int64]) The tick each cell's next growth attempt is due on
+        :param period :(ndarray[int64]) The ticks between two growth attempts of each cell
+        :param now :(int) The current game tick
+        """
+        grow = np.zeros(len(cells), dtype=np.bool_)
+        for i in range(len(cells)):
+            row, col = cells[i, 0], cells[i, 1]
+            if due[row, col] <= now:
+                due[row, col] = now + period[row, col]
+                if np.random.random() < 0.5:
+                    grow[i] = True
+        return cells[grow]
+else:
+    def grow_kernel(cells, due, period, now):
+        """Returns the (row, col) of every growing cell that advances this tick.
+        Cells that are due get rescheduled *period* ticks from *now* in place.
+
+        :param cells :(ndarray[intp]) The (row, col) of the growing cells
+        :param due :(ndarray[int64]) The tick each cell's next growth attempt is due on
+        :param period :(ndarray[int64]) The ticks between two growth attempts of each cell
+        :param now :(int) The current game tick
+        """
+        rows, cols = cells.T
+        ready = due[rows, cols] <= now
+        cells = cells[ready]
+        rows, cols = cells.T
+        due[rows, cols] = now + period[rows, cols]
+        # Only roll for the cells that are due, most ticks that is none of them.
+        return cells[np.random.randint(0, 2, size=len(cells), dtype=np.uint8) == 0]
@@ -17,6 +17,10 @@ class Camera:
     def apply(self, entity):
         return entity.rect.move(self.camera.topleft)
 
+    def apply_xy(self, entity):
+        """Same as apply but returns just the position, without creating a Rect."""
+        return entity.rect.x + self.camera.x, entity.rect.y + self.camera.y
+
     def update(self, target):
         x = -target.x
         y = -target.y
@@ -26,5 +30,5 @@ class Camera:
         y = max(-(H)+1, y)  # bottom
         x, y = self.iso.convert_cart(x, y)
         self.camera = pg.Rect(
-            x + int(WIDTH / 2), y + int(HEIGHT / 2), self.width, self.height
+            x + WIDTH // 2, y + HEIGHT // 2, self.width, self.height
         )
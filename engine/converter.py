@@ -10,12 +10,18 @@ class Converter:
         cart_x = x * self.tile_width_half
         cart_y = y * self.tile_height_half
         iso_x = cart_x - cart_y
-        iso_y = (cart_x + cart_y) / 2
+        iso_y = (cart_x + cart_y) // 2
         return iso_x, iso_y
 
     def convert_rect(self, rect_x, rect_y):
         cart_x = rect_x * self.tile_width_half
         cart_y = rect_y * self.tile_height_half
         iso_x = cart_x - cart_y
-        iso_y = (cart_x + cart_y) / 2
+        iso_y = (cart_x + cart_y) // 2
         return iso_x, iso_y
+
+    def convert_iso(self, iso_x, iso_y):
+        """Converts isometric coordinates back to (fractional) cartesian ones."""
+        cart_x = (iso_x + 2 * iso_y) / 2
+        cart_y = (2 * iso_y - iso_x) / 2
+        return cart_x / self.tile_width_half, cart_y / self.tile_height_half
@@ -5,15 +5,18 @@ from .generators import *
 from .camera import *
 from .converter import *
 from .economy import *
+from ._grow_kernel import grow_kernel
 from .loaders.save_data_handler import *
 from .loaders.plugn_handler import PluginLoader
 from .loaders.tile_loader import TileFile, TileLookup
 from .threads.WorkerThreads import WorkerThread
-from .threads.DelayedFunctions import TimeoutFunction
 from .threads.DelayedFunctions import TodoList
 from .networking.Server import ServerMain
 from .networking.Client import Client
 from PodSixNet.Connection import connection
+import numpy as np
+import math
+import queue
 import time
 import os
 
@@ -25,6 +28,11 @@ class Game:
         pg.init()
         self.TileFile = TileFile()
         self.TileLookup = TileLookup(self.TileFile)
+        self.TID_DIRT = self.TileLookup.lookup_from_title("dirt")
+        self.TID_SEED = self.TileLookup.lookup_from_title("orange tulip:seed")
+        self.TID_FLOWER = self.TileLookup.lookup_from_title("orange tulip:flower")
+        self.TID_CONCRETE = self.TileLookup.lookup_from_title("concrete")
+        self.TID_GRASS_W = self.TileLookup.lookup_from_title("grass_west")
 
         self.server = ServerMain()
         self.client = Client(host="127.0.0.1", port=35565)
@@ -45,28 +53,28 @@ class Game:
         self.all_sprites = pg.sprite.Group()
         self.tiles = pg.sprite.Group()
         self.grid_background = Grid(self, W, H)
-        self.grid_background.create_grid(1)
+        self.grid_background.create_grid(self.TileLookup.lookup_from_title("grass"))
+        self.grid_background.render()
         self.grid_foreground = Grid(self, W, H)
         self.grid_foreground.create_grid(0)
         self.player = Player(self, 2, 2)
         self.player_pos = {"x": 0, "y": 0}
         self.camera = Camera(self.grid_background.width, self.grid_background.height)
         self.threads = []
+        # Threads that have finished, removed from self.threads by _reap_threads().
+        self._dead_threads = queue.SimpleQueue()
         self.run_later = TodoList()
+        # Grid changes made by the background thread, applied on the render thread in update().
+        self._mutations = queue.SimpleQueue()
+        self._bg_thread = None
 
-        plugins = []
-        s_dir = os.getcwd()+"/plugins"
-        for file in os.listdir(s_dir):
-            if file.endswith(".py"):
-                mod_name = file[:-3]  # strip .py at the end
-                plugins.append("."+mod_name)
-
+        plugins = PluginLoader.find_plugins(os.getcwd()+"/plugins")
         self.PluginLoader = PluginLoader(self, plugins)
 
     def _run_thread(self):
         """Method that runs forever."""
         self.ticks += INTERVAL
-        self.run_later.execute_ready_functions()
+        self.run_later.execute_ready_functions(self.ticks)
         self.animate()
         self.PluginLoader.run()
 
@@ -77,18 +85,27 @@ class Game:
         connection.Pump()
         self.client.Pump()
 
+    def _bg_loop(self):
+        """Runs the network and game ticks off the render thread until the game stops."""
+        while self.playing:
+            self._net_thread()
+            self._run_thread()
+            time.sleep(self.interval / 1000)
+
     def new(self):
         """Initialize all variables and do all the setup for a new game."""
         self.server.Pump()
         self.client.Pump()
         self.client.Send({"action": "myaction", "blah": 123, "things": [3, 4, 3, 4, 7]})
+        if self._bg_thread is None:
+            self._bg_thread = WorkerThread(self._bg_loop, once=True, daemon=True, on_stop=self._dead_threads.put)
+            self.threads.append(self._bg_thread)
+            self._bg_thread.start()
 
     def run(self):
         """Game loop."""
         while self.playing:
             self.dt = self.clock.tick(FPS) / 1000
-            self._net_thread()
-            self._run_thread()
             # Catch all events.
             self.events()
             # Update data.
@@ -96,31 +113,76 @@ class Game:
             # Draw updated screen.
             self.draw()
 
+    def _reap_threads(self):
+        """Removes the threads that have finished from self.threads."""
+        while True:
+            try:
+                self.threads.remove(self._dead_threads.get_nowait())
+            except queue.Empty:
+                break
+
+    def _stop_threads(self):
+        """Stops the game loop and waits for the background thread to finish its tick."""
+        self.playing = False
+        for thread in self.threads:
+            thread.stop = True
+        if self._bg_thread is not None and self._bg_thread.is_alive():
+            self._bg_thread.join()
+        self._reap_threads()
+
     def quit(self):
         """Quit the game."""
+        self._stop_threads()
         pg.quit()
         sys.exit()
 
     def update(self):
         # Update everything here.
+        while True:
+            try:
+                mutation, *args = self._mutations.get_nowait()
+            except queue.Empty:
+                break
+            mutation(*args)
         self.grid_background.check_update_grid()
         self.grid_foreground.check_update_grid()
         self.all_sprites.update()
         self.camera.update(self.player)
 
-        for thread_index in range(0, len(self.threads)):
-            if self.threads[thread_index] is not None and self.threads[thread_index].stop:
-                self.threads[thread_index] = None
-
     def draw(self):
         """Draw the screen."""
         self.screen.fill(BGCOLOR)
-        for tile in self.tiles:
-            self.screen.blit(tile.image, self.camera.apply(tile))
-        for sprite in self.all_sprites:
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
+        camera_apply = self.camera.apply_xy
+        # The background only changes on player actions, so it is drawn pre-rendered.
+        background = self.grid_background
+        blit_sequence = [(background.surface, background.surface_rect.move(self.camera.camera.topleft))]
+        (x0, x1), (y0, y1) = self._visible_cells()
+        tiles = self.grid_foreground.grid_data
+        # Empty cells have no sprite, only visit the occupied ones.
+        for x, y in np.argwhere(self.grid_foreground.data[x0:x1, y0:y1]) + (x0, y0):
+            tile = tiles[x][y]
+            if not tile.sprite_init:
+                blit_sequence.append((tile.image, camera_apply(tile)))
+        blit_sequence.extend((sprite.image, camera_apply(sprite)) for sprite in self.all_sprites)
+        self.screen.blits(blit_sequence, doreturn=0)
         pg.display.flip()
 
+    def _visible_cells(self):
+        """Returns the row and column ranges of the grid cells that can overlap the screen."""
+        left, top = self.camera.camera.topleft
+        # A tile is drawn from its top left corner, so pad the screen by one tile up and left.
+        corners = [
+            self.iso.convert_iso(screen_x - left, screen_y - top)
+            for screen_x in (-TILEWIDTH, WIDTH) for screen_y in (-TILEHEIGHT, HEIGHT)
+        ]
+        xs = [x for x, _ in corners]
+        ys = [y for _, y in corners]
+        # Clamp to the array's shape, loaded grids are not always square.
+        row_count, col_count = self.grid_background.data.shape
+        rows = (max(0, math.floor(min(xs))), min(row_count, math.ceil(max(xs)) + 1))
+        cols = (max(0, math.floor(min(ys))), min(col_count, math.ceil(max(ys)) + 1))
+        return rows, cols
+
     def events(self):
         """Catch all events here."""
         for event in pg.event.get():
@@ -128,15 +190,10 @@ class Game:
                 self.quit()
             if event.type == pg.KEYDOWN:
                 if event.key == pg.K_ESCAPE:
+                    # Stop these threads, the background one pumps the server.
+                    self._stop_threads()
                     self.save_gamestate()
-
-                    # Stop these threads
-                    for thread in self.threads:
-                        if thread is not None:
-                            thread.stop = True
-
                     self.server.close()
-                    self.playing = False
                 if event.key == pg.K_LEFT:
                     self.player.move(dx=-1)
                 if event.key == pg.K_RIGHT:
@@ -146,17 +203,15 @@ class Game:
                 if event.key == pg.K_DOWN:
                     self.player.move(dy=1)
                 if event.key == pg.K_RETURN:
-                    self.change_tile(self.TileLookup.lookup_from_title("concrete"))
+                    self.change_tile(self.TID_CONCRETE)
                 if event.key == pg.K_1:
-                    self.change_tile(self.TileLookup.lookup_from_title("grass_west"))
+                    self.change_tile(self.TID_GRASS_W)
                 if event.key == pg.K_SPACE:
                     self.transform_tile()
 
     def transform_tile(self):
         x, y = self.player.current_position()
-        if isinstance(self.grid_background.grid_data[x][y].data, int):
-            self._dirt_transform(x, y)
-        elif self.grid_background.grid_data[x][y].data == 1:
+        if self.TileLookup.is_dirtlike[self.grid_background.data[x, y]]:
             self._dirt_transform(x, y)
         else:
             print(f'''You can't grow a crop on {self.grid_background.grid_data[x][y].tile_string}!''')
@@ -165,7 +220,7 @@ class Game:
         x, y = self.player.current_position()
         tile_title = self.TileFile.titles[data]
         back_title = self.grid_background.grid_data[x][y].tile_string
-        if self.grid_background.grid_data[x][y].data != data:
+        if self.grid_background.data[x, y] != data:
             if self.economy.check_transaction(tile_title):
                 self.grid_background.update_tile(data, x, y)
                 self.grid_background.check_update_grid()
@@ -174,93 +229,91 @@ class Game:
             print(f'''You can't place {tile_title} on a {back_title}!''')
 
     def _dirt_transform(self, x, y):
-        if self.grid_foreground.grid_data[x][y].data >= self.TileLookup.lookup_from_title("orange tulip:flower"):
+        if self.grid_foreground.data[x, y] >= self.TID_FLOWER:
             self.economy.sell(self.grid_foreground.grid_data[x][y].tile_string)
-            self.grid_foreground.update_tile(self.TileLookup.lookup_from_title("dirt"), x, y)
-            self.grid_foreground.grid_data[x][y].multi_states = False
-            self.grid_background.update_tile(self.TileLookup.lookup_from_title("dirt"), x, y)
-        elif self.grid_background.grid_data[x][y].data == self.TileLookup.lookup_from_title("dirt"):
-            self.grid_foreground.update_tile(self.TileLookup.lookup_from_title("orange tulip:seed"), x, y)
+            self.grid_foreground.update_tile(self.TID_DIRT, x, y)
+            self.grid_background.update_tile(self.TID_DIRT, x, y)
+        elif self.grid_background.data[x, y] == self.TID_DIRT:
+            self.grid_foreground.update_tile(self.TID_SEED, x, y)
             self.grid_foreground.check_update_grid()
-            self.grid_foreground.grid_data[x][y].multi_states = True
             self.economy.buy(self.grid_foreground.grid_data[x][y].tile_string)
         else:
-            self.grid_background.update_tile(self.TileLookup.lookup_from_title("dirt"), x, y)
+            self.grid_background.update_tile(self.TID_DIRT, x, y)
 
     def save_gamestate(self):
         self.grid_background.check_update_grid()
         self.grid_foreground.check_update_grid()
-        d = Data('save_data.txt')
-        maps_dict = {'maps':
-                     {'background': self.grid_background.grid_list(),
-                      'foreground': self.grid_foreground.grid_list()
-                      }}
-        player_dict = {'position':
-                       {'x': self.player.x,
-                        'y': self.player.y
-                        }}
-        economy_dict = {'money': self.economy.money}
-        d.update_file('game state', maps_dict)
-        d.update_file('economy', economy_dict)
-        d.update_file('player', player_dict)
-        d.save_to_file()
+        # Maps are saved as netIds so saves survive changes to the order of tiles.json.
+        net_ids = self.TileLookup.net_ids
+        np.savez_compressed(
+            'save_data.npz',
+            background=net_ids[self.grid_background.data],
+            foreground=net_ids[self.grid_foreground.data],
+            position=np.array([self.player.x, self.player.y], dtype=np.int32),
+            money=self.economy.money
+        )
 
     def load_gamestate(self):
         self.player.kill()
+        if not os.path.exists('save_data.npz'):
+            return self._load_legacy_gamestate()
+
+        with np.load('save_data.npz') as save:
+            background, foreground = save['background'], save['foreground']
+            x, y = save['position'].tolist()
+            money = save['money'].item()
+        self.player_pos = {'x': x, 'y': y}
+        return money, background, foreground
+
+    def _load_legacy_gamestate(self):
+        """Loads a game saved in the old save_data.txt JSON format."""
         d = Data('save_data.txt')
         self.gamestate = d.load_master_dict('game state')
-        background_list = self.gamestate['maps']['background']
-        foreground_list = self.gamestate['maps']['foreground']
+        background = np.array(self.gamestate['maps']['background'], dtype=np.float64)
+        foreground = np.array(self.gamestate['maps']['foreground'], dtype=np.float64)
         economy = d.load_master_dict('economy')
         player_data = d.load_master_dict('player')
         money = economy['money']
         self.player_pos = player_data['position']
-        return money, background_list, foreground_list
+        return money, background, foreground
 
     def load(self):
         self.all_sprites = pg.sprite.Group()
         self.tiles = pg.sprite.Group()
-        money, background_list, foreground_list = self.load_gamestate()
+        money, background, foreground = self.load_gamestate()
         self.economy = Economy(money)
-        self.grid_background = Grid(self, len(background_list), len(background_list[0]))
-        self.grid_background.load_grid(background_list)
-        self.grid_foreground = Grid(self, len(foreground_list), len(foreground_list[0]))
-        self.grid_foreground.load_grid(foreground_list)
+        self.grid_background = Grid(self, *background.shape)
+        self.grid_background.load_grid(background)
+        self.grid_background.render()
+        self.grid_foreground = Grid(self, *foreground.shape)
+        self.grid_foreground.load_grid(foreground)
         self.player = Player(self, self.player_pos['x'], self.player_pos['y'])
         self.camera = Camera(self.grid_background.width, self.grid_background.height)
         self.new()
 
+    def _grow_tile(self, old_data, new_data, x, y):
+        """Applies a growth step posted by animate, unless the tile changed since it was computed."""
+        if self.grid_foreground.data[x, y] == old_data:
+            self.grid_foreground.update_tile(new_data, x, y)
+
     def animate(self):
-        for row_nb, row in enumerate(self.grid_foreground.grid_data):
-            for col_nb, tile in enumerate(row):
-                self.display_next_state(tile, self.grid_foreground, row_nb, col_nb)
-
-        for row_nb, row in enumerate(self.grid_background.grid_data):
-            for col_nb, tile in enumerate(row):
-                self.display_next_state(tile, self.grid_background, row_nb, col_nb)
-
-    def display_next_state(self, tile: Tile, grid: Grid, row_nb, col_nb):
-        if tile.data != 0:
-            net_name = self.TileLookup.lookup_from_int(tile.data)
-            if tile.multi_states:
-                states = self.TileLookup.lookup_tile_states(net_name)
-                last = list(states)[-1]
-                do_loop = self.TileFile.loop[tile.data]
-                result = self.gen.generate_random_number(0, 1)
-                multiplier = self.TileFile.tick_multiplier[tile.data]
-
-                def actually_display():
-                    string_data = str(tile.data)
-                    split_string = string_data.split(".", 1)
-                    dec = int(split_string[1])+1
-                    new_data = float(split_string[0]+"."+str(dec))
-
-                    if new_data <= last:
-                        if result == 0:
-                            if do_loop:
-                                new_data = self.TileLookup.lookup_from_title(states[0])
-
-                            grid.update_tile(new_data, row_nb, col_nb)
-
-                func = TimeoutFunction(actually_display, self.ticks * multiplier)
-                self.run_later.add_to_list(func)
+        # Bind everything used per tile before the loop.
+        grid = self.grid_foreground
+        data = grid.data
+        first_state = self.TileLookup.first_state
+        last_state = self.TileLookup.last_state
+        loop = self.TileFile.loop
+        post = self._mutations.put
+        grow = self._grow_tile
+
+        # Roll the dice for every growing tile that is due, only tiles that won get a next state.
+        for row_nb, col_nb in grow_kernel(grid.active_cells, grid.growth_due, grid.growth_period, self.ticks):
+            tile_data = int(data[row_nb, col_nb])
+            # The states of a tile have consecutive ids, so the next state is simply the next id.
+            new_data = tile_data + 1
+            if new_data > last_state[tile_data]:
+                if not loop[tile_data]:
+                    continue
+                new_data = int(first_state[tile_data])
+
+            post((grow, tile_data, new_data, row_nb, col_nb))
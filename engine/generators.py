@@ -7,8 +7,8 @@ class Generate:
     def __init__(self):
         self.tilewidth = W
         self.tileheight = H
-        self.width = W * TILEWIDTH
-        self.height = H * TILEHEIGHT
+        self.width = GRID_PIXEL_W
+        self.height = GRID_PIXEL_H
 
     def generate_map_data(self):
         self.map_data = [
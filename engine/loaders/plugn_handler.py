@@ -2,6 +2,8 @@ import importlib
 import importlib.util
 import os
 
+from .save_data_handler import Data
+
 
 class PluginLoader:
     # We are going to receive a list of plugins as parameter
@@ -16,6 +18,32 @@ class PluginLoader:
                 self._plugins.append(mod)
                 mod.Plugin(game)
 
+    @staticmethod
+    def find_plugins(directory):
+        """Lists the plugin modules in a directory. The list is cached in .cache.json
+        and only rescanned when the directory's modification time changes."""
+        # Open the cache first, creating it changes the directory's modification time.
+        try:
+            cache = Data(os.path.join(directory, ".cache.json"))
+        except (OSError, ValueError):
+            # The cache is corrupt or can't be written, just scan the directory.
+            cache = None
+        mtime = os.stat(directory).st_mtime_ns
+        if cache is not None and isinstance(cache.data, dict) and cache.data.get("mtime") == mtime:
+            return cache.data["plugins"]
+
+        # strip .py at the end
+        with os.scandir(directory) as entries:
+            plugins = [f".{entry.name[:-3]}" for entry in entries if entry.name.endswith(".py")]
+        if cache is not None and isinstance(cache.data, dict):
+            cache.update_file("mtime", mtime)
+            cache.update_file("plugins", plugins)
+            try:
+                cache.save_to_file()
+            except OSError:
+                pass
+        return plugins
+
     def run(self):
         # We is were magic happens, and all the plugins are going to be printed
         for plugin in self._plugins:
@@ -1,3 +1,6 @@
+import numpy as np
+import pygame as pg
+
 from .save_data_handler import Data
 
 
@@ -5,11 +8,18 @@ class TileFile(Data):
     def __init__(self):
         super(TileFile, self).__init__("images/tiles.json")
 
+        # Tiles are stored under stable integer ids given out in the order they are defined,
+        # so the states of a tile get consecutive ids. id 0 is the empty tile.
+        # net_ids and ids convert between those and the JSON netIds.
+        self.net_ids = [0]
+        self.ids = {0: 0}
         self.images = {}
         self.titles = {}
         self.multi_states = {}
         self.tick_multiplier = {}
         self.loop = {}
+        # Loaded images, by image name
+        self._surfaces = {}
 
         for tile_name, tile in self.data["tiles"].items():
             is_multi_state = tile.get("multiState", False)
@@ -17,21 +27,13 @@ class TileFile(Data):
             if not is_multi_state:
                 if root_inherit is False:
                     try:
-                        self.images[tile["netId"]] = tile["image"]
-                        self.titles[tile["netId"]] = tile_name
-                        self.multi_states[tile["netId"]] = False
-                        self.tick_multiplier[tile["netId"]] = 0
-                        self.loop[tile["netId"]] = False
+                        self._add_tile(tile["netId"], tile["image"], tile_name)
                     except KeyError:
                         pass
                 else:
                     if type(root_inherit) is int:
                         try:
-                            self.images[tile["netId"]] = self.images[root_inherit]
-                            self.titles[tile["netId"]] = tile_name
-                            self.multi_states[tile["netId"]] = False
-                            self.tick_multiplier[tile["netId"]] = 0
-                            self.loop[tile["netId"]] = False
+                            self._add_tile(tile["netId"], self.images[self.ids[root_inherit]], tile_name)
                         except IndexError:
                             raise IndexError(f"JSON tile -> {tile_name}.inherit ({root_inherit})." +
                                              f"Tile {root_inherit} does not exist, Have you defined it before?")
@@ -44,40 +46,81 @@ class TileFile(Data):
                         if type(value) is dict:
                             state_inherit = value.get("inherit", False)
                             if state_inherit is False:
-                                self.images[value["netId"]] = value["image"]
-                                self.titles[value["netId"]] = tile_name + ":" + key
-                                self.multi_states[value["netId"]] = True
-                                self.tick_multiplier[value["netId"]] = states["tickMultiplier"]
-                                self.loop[value["netId"]] = states["loop"]
+                                self._add_tile(value["netId"], value["image"], tile_name + ":" + key,
+                                               True, states["tickMultiplier"], states["loop"])
                             else:
                                 if type(state_inherit) is int:
-                                    self.images[value["netId"]] = self.images[state_inherit]
-                                    self.titles[value["netId"]] = tile_name + ":" + key
-                                    self.multi_states[value["netId"]] = True
-                                    self.tick_multiplier[value["netId"]] = states["tickMultiplier"]
-                                    self.loop[value["netId"]] = states["loop"]
+                                    self._add_tile(value["netId"], self.images[self.ids[state_inherit]],
+                                                   tile_name + ":" + key, True, states["tickMultiplier"],
+                                                   states["loop"])
                                 else:
                                     raise TypeError(f"JSON tile -> {tile_name}.states.{key}.inherit must be type of "
                                                     f"int or str")
                 except KeyError:
                     pass
 
+    def _add_tile(self, net_id, image, title, multi_state=False, tick_multiplier=0, loop=False):
+        """Registers a tile under the next free id and returns that id."""
+        tile_id = len(self.net_ids)
+        self.net_ids.append(net_id)
+        self.ids[net_id] = tile_id
+        self.images[tile_id] = image
+        self.titles[tile_id] = title
+        self.multi_states[tile_id] = multi_state
+        self.tick_multiplier[tile_id] = tick_multiplier
+        self.loop[tile_id] = loop
+        return tile_id
+
+    def load_image(self, image):
+        """Loads a tile image once and converts it to the display's pixel format, so blits
+        take the fast path. The display mode must be set before the first call.
+
+        :param image :(str) The image name, as found in images
+        """
+        surface = self._surfaces.get(image)
+        if surface is None:
+            surface = pg.image.load(f"""images/{image}.png""")
+            if surface.get_flags() & pg.SRCALPHA:
+                surface = surface.convert_alpha()
+            else:
+                surface = surface.convert()
+            self._surfaces[image] = surface
+        return surface
+
 
 class TileLookup:
     def __init__(self, tileFile):
         self.tileFile = None
         if isinstance(tileFile, TileFile):
             self.tileFile = tileFile
+
+            # Lookup tables indexed by tile id, so per tile checks are a single array load.
+            self.net_ids = np.array(tileFile.net_ids, dtype=np.float64)
+            # Tiles with a whole number netId are base tiles that can be dug up into dirt.
+            self.is_dirtlike = np.array([isinstance(net_id, int) for net_id in tileFile.net_ids], dtype=bool)
+            self.is_multi_state = np.array(
+                [tileFile.multi_states.get(tile_id, False) for tile_id in range(len(tileFile.net_ids))], dtype=bool
+            )
+            self.tick_multiplier = np.array(
+                [tileFile.tick_multiplier.get(tile_id, 0) for tile_id in range(len(tileFile.net_ids))], dtype=np.int64
+            )
+            # The first and last state of every tile, a tile without states is its own first and last state.
+            self.first_state = np.arange(len(tileFile.net_ids), dtype=np.int16)
+            self.last_state = self.first_state.copy()
+            for tile_id, multi_state in tileFile.multi_states.items():
+                if multi_state:
+                    states = list(self.lookup_tile_states(tileFile.titles[tile_id]))
+                    self.first_state[tile_id], self.last_state[tile_id] = states[0], states[-1]
             return
 
         raise TypeError("tileFile must be type of TileFile")
 
-    def lookup_from_int(self, netId: int) -> str:
-        """The fastest mode of lookup since the names are stored in a netId indexed array
+    def lookup_from_int(self, tileId: int) -> str:
+        """The fastest mode of lookup since the names are stored in a tile id indexed array
 
-        :param netId :(int) The associated network id of the tile
+        :param tileId :(int) The associated id of the tile
         """
-        return self.tileFile.titles[netId]
+        return self.tileFile.titles[tileId]
 
     def lookup_from_title(self, title: str) -> int:
         """The slowest mode of lookup since the we have to loop the tiles array and compare
@@ -90,6 +133,18 @@ class TileLookup:
                 return tile
         return -1
 
+    def lookup_from_net_ids(self, net_ids) -> np.ndarray:
+        """Converts an array of netIds to tile ids, netIds that don't exist become the error tile
+
+        :param net_ids :(array_like) The associated network ids of the tiles
+        """
+        net_ids = np.asarray(net_ids, dtype=np.float64)
+        order = np.argsort(self.net_ids)
+        sorted_net_ids = self.net_ids[order]
+        index = np.minimum(np.searchsorted(sorted_net_ids, net_ids), len(order) - 1)
+        tile_ids = np.where(sorted_net_ids[index] == net_ids, order[index], self.tileFile.ids[-1])
+        return tile_ids.astype(np.int16)
+
     def lookup_tile_states(self, title: str) -> dict[...]:
         """Use a tile name or state name to lookup all the tile's states"""
         head = self.lookup_base_name(title)
@@ -1,25 +1,70 @@
+import binascii
+import functools
 import json
 import string
 import struct
 import zlib
 
+import numpy as np
+
 from ..networking.types.buffer import BufferUnderrun
 from ..networking.types.uuid import UUID
 from ..networking.types import nbt
 from ..types.registry import OpaqueRegistry
 
+try:
+    from . import _buffer
+except ImportError:
+    _buffer = None
+
 
 directions = ("down", "up", "north", "south", "west", "east")
+_direction_index = {direction: index for index, direction in enumerate(directions)}
+
+# Maps the bytes hexdump shows as text to themselves and everything else to ".".
+_printable = frozenset((string.ascii_letters + string.digits + string.punctuation).encode("ascii"))
+_printable_table = bytes(byte if byte in _printable else ord(".") for byte in range(256))
+
+# The continuation bits of the first 0-5 bytes of a little-endian word.
+_continuation_bits = (0, 0x80, 0x8080, 0x808080, 0x80808080, 0x8080808080)
+
+# The length of a varint, indexed by the bit length of its value.
+_varint_length = (1,) + tuple((bits + 6) // 7 for bits in range(1, 36))
+
+
+@functools.lru_cache(maxsize=256)
+def _struct(fmt):
+    """
+    Returns the compiled big-endian struct for *fmt*.
+    """
+
+    return struct.Struct(">" + fmt)
+
+
+# The big-endian numpy dtype of the numeric struct formats.
+_array_dtypes = {fmt: np.dtype(">" + fmt) for fmt in "bBhHiIqQfd"}
+
+
+# Structs used by the packers below, looked up once.
+_struct_B = _struct("B")
+_struct_Q = _struct("Q")
+_struct_h = _struct("h")
+_struct_b = _struct("b")
+_struct_hbh = _struct("hbh")
+_struct_hbhB = _struct("hbhB")
+_struct_fff = _struct("fff")
 
 
 class Buffer(object):
-    buff = b""
-    pos = 0
+    __slots__ = ('buff', 'pos')
     registry = OpaqueRegistry(13)
+    # zlib level for compressed packets, favouring speed over size.
+    compression_level = 1
 
     def __init__(self, data=None):
-        if data:
-            self.buff = data
+        # A bytearray, so adding and saving do not copy the whole buffer.
+        self.buff = bytearray(data) if data else bytearray()
+        self.pos = 0
 
     def __len__(self):
         return len(self.buff) - self.pos
@@ -29,14 +74,14 @@ class Buffer(object):
         Add some bytes to the end of the buffer.
         """
 
-        self.buff += data
+        self.buff.extend(data)
 
     def save(self):
         """
         Saves the buffer contents.
         """
 
-        self.buff = self.buff[self.pos:]
+        del self.buff[:self.pos]
         self.pos = 0
 
     def restore(self):
@@ -60,45 +105,54 @@ class Buffer(object):
         *length* is ``None``
         """
 
+        # Slice a view rather than the bytearray, so the data is only copied once.
         if length is None:
-            data = self.buff[self.pos:]
+            data = bytes(memoryview(self.buff)[self.pos:])
             self.pos = len(self.buff)
         else:
-            if self.pos + length > len(self.buff):
+            if length < 0 or self.pos + length > len(self.buff):
                 raise BufferUnderrun()
 
-            data = self.buff[self.pos:self.pos+length]
+            data = bytes(memoryview(self.buff)[self.pos:self.pos+length])
             self.pos += length
 
         return data
 
+    def read_view(self, length=None):
+        """
+        Like :meth:`read`, but returns a memoryview of the buffer instead of
+        copying the bytes out. The buffer cannot be added to or saved until
+        the view is released.
+        """
+
+        if length is None:
+            view = memoryview(self.buff)[self.pos:]
+            self.pos = len(self.buff)
+        else:
+            if length < 0 or self.pos + length > len(self.buff):
+                raise BufferUnderrun()
+
+            view = memoryview(self.buff)[self.pos:self.pos+length]
+            self.pos += length
+
+        return view
+
     def hexdump(self):
-        printable = string.ascii_letters + string.digits + string.punctuation
         data = self.buff[self.pos:]
         lines = ['']
-        bytes_read = 0
-        while len(data) > 0:
-            data_line, data = data[:16], data[16:]
-
-            l_hex = []
-            l_str = []
-            for i, c in enumerate(data_line):
-                l_hex.append("%02x" % c)
-                c_str = data_line[i:i + 1]
-                l_str.append(
-                    c_str if c_str in printable else ".")
+        for bytes_read in range(0, len(data), 16):
+            data_line = data[bytes_read:bytes_read + 16]
 
-            l_hex.extend(['  '] * (16 - len(l_hex)))
-            l_hex.insert(8, '')
+            # Two groups of eight bytes, padded to a full line.
+            l_hex = binascii.hexlify(data_line, " ").decode("ascii").ljust(47)
+            l_str = data_line.translate(_printable_table).decode("ascii")
 
             lines.append("%08x  %s  |%s|" % (
                 bytes_read,
-                " ".join(l_hex),
-                "".join(l_str)))
+                l_hex[:23] + " " + l_hex[23:],
+                l_str))
 
-            bytes_read += len(data_line)
-
-        return "\n    ".join(lines + ["%08x" % bytes_read])
+        return "\n    ".join(lines + ["%08x" % len(data)])
 
     # Basic data types --------------------------------------------------------
 
@@ -109,18 +163,31 @@ class Buffer(object):
         ``struct.pack()``.
         """
 
-        return struct.pack(">"+fmt, *fields)
+        return _struct(fmt).pack(*fields)
 
     def unpack(self, fmt):
         """
-        Unpack a struct. The format accepted is the same as for
+        Unpack a struct into a tuple. The format accepted is the same as for
         ``struct.unpack()``.
         """
-        fmt = ">" + fmt
-        data = self.read(struct.calcsize(fmt))
-        fields = struct.unpack(fmt, data)
-        if len(fields) == 1:
-            fields = fields[0]
+        return self._unpack_struct(_struct(fmt))
+
+    def unpack_one(self, fmt):
+        """
+        Unpack a struct of a single field and return the field.
+        """
+        field, = self._unpack_struct(_struct(fmt))
+        return field
+
+    def _unpack_struct(self, compiled):
+        """
+        Unpack a compiled struct.
+        """
+        if self.pos + compiled.size > len(self.buff):
+            raise BufferUnderrun()
+
+        fields = compiled.unpack_from(self.buff, self.pos)
+        self.pos += compiled.size
         return fields
 
     # Array data types --------------------------------------------------------
@@ -136,10 +203,23 @@ class Buffer(object):
     def unpack_array(self, fmt, length):
         """
         Unpack an array struct. The format accepted is the same as for
-        ``struct.unpack()``.
+        ``struct.unpack()``. Arrays of a single number type are returned as
+        a numpy array.
         """
-        data = self.read(struct.calcsize(">" + fmt) * length)
-        return list(struct.unpack(">" + fmt * length, data))
+        dtype = _array_dtypes.get(fmt)
+        if dtype is not None:
+            # numpy reads a negative count as the rest of the buffer.
+            if length < 0 or self.pos + dtype.itemsize * length > len(self.buff):
+                raise BufferUnderrun()
+
+            array = np.frombuffer(self.buff, dtype=dtype, count=length, offset=self.pos)
+            self.pos += array.nbytes
+            # Converting to native byte order also copies it out of the buffer.
+            return array.astype(dtype.newbyteorder("="))
+
+        compiled = _struct(fmt)
+        data = self.read(compiled.size * length)
+        return [field for fields in compiled.iter_unpack(data) for field in fields]
 
     # Optional ----------------------------------------------------------------
 
@@ -160,7 +240,7 @@ class Buffer(object):
         Unpacks a boolean. If it's True, return the value of ``unpacker()``.
         Otherwise return None.
         """
-        if self.unpack('?'):
+        if self.unpack_one('?'):
             return unpacker()
         else:
             return None
@@ -173,6 +253,9 @@ class Buffer(object):
         Packs a varint.
         """
 
+        if 0 <= number < 0x80 and max_bits > 7:
+            return bytes((number,))
+
         number_min = -1 << (max_bits - 1)
         number_max = +1 << (max_bits - 1)
         if not (number_min <= number < number_max):
@@ -182,26 +265,62 @@ class Buffer(object):
         if number < 0:
             number += 1 << 32
 
-        out = b""
+        if 0 <= number < 1 << 35:
+            # Spread the 7-bit groups one per byte, set the continuation bit of
+            # all but the last byte and write them out in one go.
+            length = _varint_length[number.bit_length()]
+            word = ((number & 0x7F) |
+                    (number << 1 & 0x7F << 8) |
+                    (number << 2 & 0x7F << 16) |
+                    (number << 3 & 0x7F << 24) |
+                    (number << 4 & 0x7F << 32))
+            return (word | _continuation_bits[length - 1]).to_bytes(length, "little")
+
+        out = bytearray()
         for i in range(10):
             b = number & 0x7F
             number >>= 7
-            out += cls.pack("B", b | (0x80 if number > 0 else 0))
+            out.append(b | (0x80 if number > 0 else 0))
             if number == 0:
                 break
-        return out
+        return bytes(out)
 
     def unpack_varint(self, max_bits=32):
         """
         Unpacks a varint.
         """
 
-        number = 0
-        for i in range(10):
-            b = self.unpack("B")
-            number |= (b & 0x7F) << 7*i
-            if not b & 0x80:
-                break
+        # Most varints are a single byte.
+        if self.pos < len(self.buff) and max_bits > 7:
+            number = self.buff[self.pos]
+            if number < 0x80:
+                self.pos += 1
+                return number
+
+        # Load up to 5 bytes as one little-endian int. The lowest byte without
+        # its continuation bit set ends the varint.
+        data = self.buff[self.pos:self.pos+5]
+        word = int.from_bytes(data, "little")
+        ends = ~word & _continuation_bits[len(data)]
+        if ends:
+            length = (ends & -ends).bit_length() // 8
+            self.pos += length
+            # Gather the 7-bit groups of all 5 bytes, then drop the bytes past the end.
+            number = ((word & 0x7F) |
+                      (word >> 1 & 0x7F << 7) |
+                      (word >> 2 & 0x7F << 14) |
+                      (word >> 3 & 0x7F << 21) |
+                      (word >> 4 & 0x7F << 28)) & ((1 << 7*length) - 1)
+        elif len(data) < 5:
+            raise BufferUnderrun()
+        else:
+            # Longer than 5 bytes, too big for 32 bits.
+            number = 0
+            for i in range(10):
+                b, = self._unpack_struct(_struct_B)
+                number |= (b & 0x7F) << 7*i
+                if not b & 0x80:
+                    break
 
         if number & (1 << 31):
             number -= 1 << 32
@@ -214,6 +333,43 @@ class Buffer(object):
 
         return number
 
+    @classmethod
+    def pack_varints(cls, numbers, max_bits=32):
+        """
+        Packs varints back to back.
+        """
+
+        pack_varint = cls.pack_varint
+        single_byte = max_bits > 7
+        out = bytearray()
+        for number in numbers:
+            if single_byte and 0 <= number < 0x80:
+                out.append(number)
+            else:
+                out += pack_varint(number, max_bits)
+        return bytes(out)
+
+    def unpack_varints(self, count, max_bits=32):
+        """
+        Unpacks *count* varints packed back to back.
+        """
+
+        buff = self.buff
+        size = len(buff)
+        single_byte = max_bits > 7
+        numbers = [0] * count
+        pos = self.pos
+        for i in range(count):
+            if single_byte and pos < size and buff[pos] < 0x80:
+                numbers[i] = buff[pos]
+                pos += 1
+            else:
+                self.pos = pos
+                numbers[i] = self.unpack_varint(max_bits)
+                pos = self.pos
+        self.pos = pos
+        return numbers
+
     # Packet ------------------------------------------------------------------
 
     @classmethod
@@ -223,30 +379,51 @@ class Buffer(object):
         compression.
         """
 
-        if compression_threshold >= 0:
-            # Compress data and prepend uncompressed data length
-            if len(data) >= compression_threshold:
-                data = cls.pack_varint(len(data)) + zlib.compress(data)
-            else:
-                data = cls.pack_varint(0) + data
+        if compression_threshold < 0:
+            # Prepend packet length
+            return cls.pack_varint(len(data), max_bits=32) + data
+
+        # Compress data and prepend uncompressed data length
+        if len(data) >= compression_threshold:
+            prefix, data = cls.pack_varint(len(data)), zlib.compress(data, cls.compression_level)
+        else:
+            prefix = cls.pack_varint(0)
 
-        # Prepend packet length
-        return cls.pack_varint(len(data), max_bits=32) + data
+        # Prepend packet length, joining everything with a single copy
+        length = cls.pack_varint(len(prefix) + len(data), max_bits=32)
+        return b"".join((length, prefix, data))
 
     def unpack_packet(self, cls, compression_threshold=-1):
         """
         Unpacks a packet frame. This method handles length-prefixing and
         compression.
         """
-        body = self.read(self.unpack_varint(max_bits=32))
-        buff = cls(body)
+        length = self.unpack_varint(max_bits=32)
+        if length < 0:
+            raise BufferUnderrun()
+
         if compression_threshold >= 0:
-            uncompressed_length = buff.unpack_varint()
-            if uncompressed_length > 0:
-                body = zlib.decompress(buff.read())
-                buff = cls(body)
+            # Read the uncompressed length in place rather than through a
+            # throwaway buffer of the whole frame.
+            start = self.pos
+            uncompressed_length = self.unpack_varint()
+            length -= self.pos - start
+            if length < 0:
+                raise BufferUnderrun()
 
-        return buff
+            if uncompressed_length > 0:
+                # Inflate no more than the declared length, so a small packet
+                # cannot expand into an arbitrarily large one.
+                inflate = zlib.decompressobj()
+                with self.read_view(length) as body:
+                    data = inflate.decompress(body, uncompressed_length)
+                if inflate.unconsumed_tail:
+                    raise ValueError("packet inflates past its declared length: %d"
+                                     % uncompressed_length)
+                return cls(data)
+
+        with self.read_view(length) as body:
+            return cls(body)
 
     # String ------------------------------------------------------------------
 
@@ -265,7 +442,15 @@ class Buffer(object):
         """
 
         length = self.unpack_varint(max_bits=16)
-        text = self.read(length).decode("utf-8")
+        end = self.pos + length
+        # A negative length would move the position backwards.
+        if length < 0 or end > len(self.buff):
+            raise BufferUnderrun()
+
+        # No separate ASCII path, the utf-8 codec already decodes ASCII runs
+        # a word at a time and an isascii() check costs more than it saves.
+        text = self.buff[self.pos:end].decode("utf-8")
+        self.pos = end
         return text
 
     # JSON --------------------------------------------------------------------
@@ -310,30 +495,23 @@ class Buffer(object):
         Packs a Position.
         """
 
-        def pack_twos_comp(bits, number):
-            if number < 0:
-                number = number + (1 << bits)
-            return number
-
-        return cls.pack('Q', sum((
-            pack_twos_comp(26, x) << 38,
-            pack_twos_comp(12, y) << 26,
-            pack_twos_comp(26, z))))
+        # Masking each field gives its two's complement.
+        return _struct_Q.pack(
+            (x & 0x3FFFFFF) << 38 | (y & 0xFFF) << 26 | (z & 0x3FFFFFF))
 
     def unpack_position(self):
         """
         Unpacks a position.
         """
 
-        def unpack_twos_comp(bits, tc_number):
-            if (tc_number & (1 << (bits - 1))) != 0:
-                tc_number = tc_number - (1 << bits)
-            return tc_number
-
-        number = self.unpack('Q')
-        x = unpack_twos_comp(26, (number >> 38))
-        y = unpack_twos_comp(12, (number >> 26 & 0xFFF))
-        z = unpack_twos_comp(26, (number & 0x3FFFFFF))
+        number, = self._unpack_struct(_struct_Q)
+        # Sign extend each field by subtracting its sign bit twice.
+        x = number >> 38
+        x -= (x & 0x2000000) << 1
+        y = number >> 26 & 0xFFF
+        y -= (y & 0x800) << 1
+        z = number & 0x3FFFFFF
+        z -= (z & 0x2000000) << 1
         return x, y, z
 
     # Block -------------------------------------------------------------------
@@ -364,10 +542,13 @@ class Buffer(object):
         """
 
         if item is None:
-            return cls.pack('h', -1)
+            return _struct_h.pack(-1)
 
         item_id = cls.registry.encode('mega_cities:item', item)
-        return cls.pack('hbh', item_id, count, damage) + cls.pack_nbt(tag)
+        if tag is None:
+            # Pack the empty NBT tag's end byte along with the fields.
+            return _struct_hbhB.pack(item_id, count, damage, 0)
+        return _struct_hbh.pack(item_id, count, damage) + cls.pack_nbt(tag)
 
     def unpack_slot(self):
         """
@@ -375,13 +556,13 @@ class Buffer(object):
         """
 
         slot = {}
-        item_id = self.unpack('h')
+        item_id, = self._unpack_struct(_struct_h)
         if item_id == -1:
             slot['item'] = None
         else:
             slot['item'] = self.registry.decode('mega_cities:item', item_id)
-            slot['count'] = self.unpack('b')
-            slot['damage'] = self.unpack('h')
+            slot['count'], = self._unpack_struct(_struct_b)
+            slot['damage'], = self._unpack_struct(_struct_h)
             slot['tag'] = self.unpack_nbt()
 
         return slot
@@ -416,7 +597,11 @@ class Buffer(object):
         Packs a direction.
         """
 
-        return cls.pack_varint(directions.index(direction))
+        try:
+            index = _direction_index[direction]
+        except KeyError:
+            raise ValueError("unknown direction: %r" % (direction,))
+        return cls.pack_varint(index)
 
     def unpack_direction(self):
         """
@@ -433,11 +618,20 @@ class Buffer(object):
         Packs a rotation.
         """
 
-        return cls.pack('fff', x, y, z)
+        return _struct_fff.pack(x, y, z)
 
     def unpack_rotation(self):
         """
         Unpacks a rotation
         """
 
-        return self.unpack('fff')
+        return self._unpack_struct(_struct_fff)
+
+
+if _buffer is not None:
+    # Use the compiled versions of the hot methods.
+    Buffer.pack_varint = classmethod(_buffer.pack_varint)
+    Buffer.unpack_varint = _buffer.unpack_varint
+    Buffer.unpack_string = _buffer.unpack_string
+    Buffer.pack_position = classmethod(_buffer.pack_position)
+    Buffer.unpack_position = _buffer.unpack_position
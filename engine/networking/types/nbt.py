@@ -50,7 +50,7 @@ class _DataTag(_Tag):
 
     @classmethod
     def from_buff(cls, buff):
-        return cls(buff.unpack(cls.fmt))
+        return cls(buff.unpack_one(cls.fmt))
 
     def to_bytes(self):
         return Buffer.pack(self.fmt, self.value)
@@ -62,7 +62,7 @@ class _ArrayTag(_Tag):
 
     @classmethod
     def from_buff(cls, buff):
-        length = buff.unpack('i')
+        length = buff.unpack_one('i')
         data = buff.read(length * (cls.width // 8))
         return cls(PackedArray.from_bytes(data, length, cls.width, cls.width))
 
@@ -112,7 +112,7 @@ class TagString(_Tag):
 
     @classmethod
     def from_buff(cls, buff):
-        string_length = buff.unpack('H')
+        string_length = buff.unpack_one('H')
         return cls(buff.read(string_length).decode('utf8'))
 
     def to_bytes(self):
@@ -170,7 +170,7 @@ class TagCompound(_Tag):
             value = {}
 
         while True:
-            kind_id = buff.unpack('b')
+            kind_id = buff.unpack_one('b')
             if kind_id == 0:
                 return cls(value)
             kind = _kinds[kind_id]
@@ -21,8 +21,11 @@ W = 20
 H = 20
 TILEWIDTH = 128
 TILEHEIGHT = 128
-TILEHEIGHT_HALF = TILEHEIGHT / 2
-TILEWIDTH_HALF = TILEWIDTH / 2
+TILEHEIGHT_HALF = TILEHEIGHT // 2
+TILEWIDTH_HALF = TILEWIDTH // 2
+# Size of the default grid in pixels
+GRID_PIXEL_W = TILEWIDTH * W
+GRID_PIXEL_H = TILEHEIGHT * H
 
 # Gameplay settings
 STARTINGMONEY = 1000
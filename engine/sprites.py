@@ -1,3 +1,4 @@
+import numpy as np
 import pygame as pg
 
 from .settings import *
@@ -35,28 +36,46 @@ class Player(pg.sprite.Sprite):
 
 class Tile(pg.sprite.Sprite):
     """All entities that make up the grid background
-    is currently handled in this class."""
+    is currently handled in this class. The tile's data is read
+    from and written to its grid's arrays."""
 
-    def __init__(self, grid, game, data, x, y):
+    def __init__(self, grid, game, x, y):
         super(Tile, self).__init__()
-        self.data = data
         self.game = game
         self.grid = grid
 
         # Flags to check if other processes are needed.
         self.flag = False
         self.sprite_init = True
-        self.multi_states = False
         self.x, self.y = x, y
 
         self.tile_data = None
-        self.tile_string = None
 
-        if self.data is not None and self.data != 0:
+        if self.data != 0:
             self.check_data()
             self.init_sprite()
             self.load_sprite()
 
+    @property
+    def data(self):
+        return self.grid.data[self.x, self.y]
+
+    @data.setter
+    def data(self, data):
+        self.grid.data[self.x, self.y] = data
+
+    @property
+    def multi_states(self):
+        return self.grid.multi_states[self.x, self.y]
+
+    @multi_states.setter
+    def multi_states(self, multi_states):
+        self.grid.multi_states[self.x, self.y] = multi_states
+
+    @property
+    def tile_string(self):
+        return self.game.TileFile.titles.get(self.data)
+
     def init_sprite(self):
         """Creates a sprite."""
         groups = self.game.tiles
@@ -66,7 +85,7 @@ class Tile(pg.sprite.Sprite):
     def load_sprite(self):
         """Gives the sprite an image to show."""
         self.check_data()
-        self.image = pg.image.load(f"""images/{self.tile_data}.png""").convert_alpha()
+        self.image = self.game.TileFile.load_image(self.tile_data)
         self.rect = self.image.get_rect()
         iso = Converter()
         # Convert cartesian to isometric coordinates
@@ -75,11 +94,9 @@ class Tile(pg.sprite.Sprite):
     def check_data(self):
         """Checks the data in the Tile object
         and selects the image to display."""
-        tiles_len = len(self.game.TileFile.images)-1
-        if self.data > tiles_len:
-            self.data = -1
+        if self.data not in self.game.TileFile.images:
+            self.data = self.game.TileFile.ids[-1]
         self.tile_data = self.game.TileFile.images[self.data]
-        self.tile_string = self.game.TileFile.titles[self.data]
         self.multi_states = self.game.TileFile.multi_states[self.data]
 
     def update_tile_image(self):
@@ -91,81 +108,109 @@ class Tile(pg.sprite.Sprite):
             self.flag = False
         else:
             self.check_data()
-            self.image = pg.image.load(
-                f"""images/{self.tile_data}.png"""
-            ).convert_alpha()
+            self.image = self.game.TileFile.load_image(self.tile_data)
             self.flag = False
 
 
 class Grid:
     def __init__(self, game, width, height):
-        """Initialize a grid object with dimensions width x height that contains
-        Tile objects with specified data. All the tile objects are held in a list
-        array."""
+        """Initialize a grid object with dimensions width x height. The tile data is
+        held in arrays (data, multi_states) and the Tile objects that render it are
+        held in a list array."""
         self.game = game
         self.w = width
         self.h = height
         self.width = width * TILEWIDTH
         self.height = height * TILEHEIGHT
-        self.grid_data = [[Tile(None, game, None, None, None) for _ in range(self.w)] for _ in range(self.h)]
+        self.data = np.zeros((self.h, self.w), dtype=np.int16)
+        self.multi_states = np.zeros((self.h, self.w), dtype=bool)
+        self.grid_data = []
+        # Cells changed by update_tile since the last check_update_grid.
+        self._dirty_cells = set()
+        # The (row, col) of every multi-state cell, as a set and as an array for the growth kernel.
+        self._active = set()
+        self.active_cells = np.empty((0, 2), dtype=np.intp)
+        # Game ticks between two growth attempts of each cell, and the tick its next attempt is due on.
+        self.growth_period = np.zeros((self.h, self.w), dtype=np.int64)
+        self.growth_due = np.zeros((self.h, self.w), dtype=np.int64)
+        # Pre-rendered tiles and the isometric area they cover, see render().
+        self.surface = None
+        self.surface_rect = None
+
+    def _create_tiles(self):
+        """Creates the Tile objects for the data in the grid's arrays."""
+        self.multi_states = self.game.TileLookup.is_multi_state[self.data]
+        self.active_cells = np.argwhere(self.multi_states)
+        self._active = set(map(tuple, self.active_cells.tolist()))
+        self.growth_period = INTERVAL * self.game.TileLookup.tick_multiplier[self.data]
+        self.growth_due = self.game.ticks + self.growth_period
+        rows, cols = self.data.shape
+        self.grid_data = [[Tile(self, self.game, row_nb, col_nb) for col_nb in range(cols)] for row_nb in range(rows)]
 
     def create_grid(self, data):
         """Creates a grid with specified data population."""
-        self.grid_data = [[data for _ in range(self.w)] for _ in range(self.h)]
-        for row_nb, row in enumerate(self.grid_data):
-            for col_nb, tile in enumerate(row):
-                self.grid_data[row_nb][col_nb] = Tile(
-                    self, self.game, data, row_nb, col_nb
-                )
+        self.data[:] = data
+        self._create_tiles()
 
     def load_grid(self, grid_list):
-        self.grid_data = [
-            [0 for _ in range(self.w)] for _ in range(self.h)
-        ]
-        """Saves games states by saving tile_data in a list array."""
-        for row_nb, row in enumerate(grid_list):
-            for col_nb, tile in enumerate(row):
-                if isinstance(col_nb, int) and isinstance(row_nb, int):
-                    self.grid_data[row_nb][col_nb] = Tile(
-                        self, self.game, grid_list[row_nb][col_nb], row_nb, col_nb
-                    )
-                    continue
-
-                raise TypeError(f"row_nb: {row_nb} & col_nb:{col_nb} must be type of int")
+        """Loads games states from an array of tile netIds."""
+        self.data = self.game.TileLookup.lookup_from_net_ids(grid_list)
+        self._create_tiles()
 
     def update_tile(self, data, x, y):
         """Updates a tile at the specified coordinates."""
-        tile = self.grid_data[x][y]
-        if isinstance(tile, Tile):
-            tile.flag = True
-            tile.data = data
-            return
-
-        raise TypeError("tile must be type of Tile")
+        self.data[x, y] = data
+        multi_states = self.game.TileLookup.is_multi_state[data]
+        self.multi_states[x, y] = multi_states
+        self.growth_period[x, y] = INTERVAL * self.game.TileLookup.tick_multiplier[data]
+        if multi_states != ((x, y) in self._active):
+            if multi_states:
+                # The tile just started growing, schedule its first attempt.
+                self.growth_due[x, y] = self.game.ticks + self.growth_period[x, y]
+                self._active.add((x, y))
+            else:
+                self._active.discard((x, y))
+            # Replaced rather than changed in place, the growth tick reads it from another thread.
+            self.active_cells = np.array(sorted(self._active), dtype=np.intp).reshape(-1, 2)
+        self.grid_data[x][y].flag = True
+        self._dirty_cells.add((x, y))
 
     def check_update_grid(self):
         """Check if the grid needs to be updated."""
-        for row_nb, row in enumerate(self.grid_data):
-            for col_nb, tile in enumerate(row):
-                if isinstance(tile, Tile):
-                    if tile.flag:
-                        tile.update_tile_image()
-                    continue
+        if not self._dirty_cells:
+            return
+
+        dirty_cells, self._dirty_cells = self._dirty_cells, set()
+        for x, y in dirty_cells:
+            self.grid_data[x][y].update_tile_image()
+            if self.surface is not None:
+                self._render_area(self.grid_data[x][y].rect)
+
+    def render(self):
+        """Pre-renders all the tiles onto one surface, so the grid can be drawn with a single blit.
+        The surface is kept up to date by check_update_grid."""
+        rects = [tile.rect for row in self.grid_data for tile in row if not tile.sprite_init]
+        if not rects:
+            return
 
-                raise TypeError(f"tile {row_nb}:{col_nb} must be type of Tile")
+        self.surface_rect = rects[0].unionall(rects)
+        self.surface = pg.Surface(self.surface_rect.size, pg.SRCALPHA)
+        self._render_area(self.surface_rect)
+
+    def _render_area(self, area):
+        """Redraws the tiles overlapping an isometric area onto the pre-rendered surface."""
+        offset = (-self.surface_rect.x, -self.surface_rect.y)
+        # Neighbouring tiles overlap, so redraw all of them in order rather than just pasting the new one on top.
+        self.surface.set_clip(area.move(offset))
+        self.surface.fill((0, 0, 0, 0))
+        self.surface.blits(
+            [(tile.image, tile.rect.move(offset)) for row in self.grid_data for tile in row
+             if not tile.sprite_init and tile.rect.colliderect(area)],
+            doreturn=0
+        )
+        self.surface.set_clip(None)
 
     def grid_list(self):
-        grid_list = [
-            [0 for _ in range(len(self.grid_data[1]))]
-            for _ in range(len(self.grid_data))
-        ]
-        """Saves games states by saving tile_data in a list array."""
-        for row_nb, row in enumerate(self.grid_data):
-            for col_nb, tile in enumerate(row):
-                tile = self.grid_data[row_nb][col_nb]
-                if isinstance(tile, Tile):
-                    grid_list[row_nb][col_nb] = tile.data
-                    continue
-
-                raise TypeError(f"tile {row_nb}:{col_nb} must be type of Tile")
-        return grid_list
+        """Saves games states by saving the tile netIds in a list array."""
+        net_ids = self.game.TileFile.net_ids
+        return [[net_ids[data] for data in row] for row in self.data.tolist()]
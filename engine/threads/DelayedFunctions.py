@@ -1,37 +1,29 @@
-from datetime import datetime, timedelta
 import heapq
+import itertools
 
 
-# just holds a function, its arguments, and when we want it to execute.
+# just holds a function, its arguments, and the game tick we want it to execute on.
 class TimeoutFunction:
-    def __init__(self, function, timeout, *args):
+    def __init__(self, function, due, *args):
         self.function = function
         self.args = args
-        self.startTime = datetime.now() + timedelta(0, 0, 0, timeout)
+        self.due = due
 
     def execute(self):
         self.function(*self.args)
 
 
 # A "todo" list for all the TimeoutFunctions we want to execute in the future
-# They are sorted in the order they should be executed, thanks to heapq
+# They are kept in a heap keyed by their due tick, the counter breaks ties in insertion order
 class TodoList:
     def __init__(self):
         self.todo = []
+        self._counter = itertools.count()
 
     def add_to_list(self, tFunction):
-        heapq.heappush(self.todo, (tFunction.startTime, tFunction))
+        heapq.heappush(self.todo, (tFunction.due, next(self._counter), tFunction))
 
-    def execute_ready_functions(self):
-        if len(self.todo) > 0:
-            t_function = heapq.heappop(self.todo)[1]
-            while t_function and datetime.now() > t_function.startTime:
-                # execute all the functions that are ready
-                t_function.execute()
-                if len(self.todo) > 0:
-                    t_function = heapq.heappop(self.todo)[1]
-                else:
-                    t_function = None
-            if t_function:
-                # this one's not ready yet, push it back on
-                heapq.heappush(self.todo, (t_function.startTime, t_function))
+    def execute_ready_functions(self, now):
+        # execute all the functions that are ready
+        while self.todo and self.todo[0][0] <= now:
+            heapq.heappop(self.todo)[2].execute()
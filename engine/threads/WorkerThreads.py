@@ -2,18 +2,24 @@ import threading
 
 
 class WorkerThread(threading.Thread):
-    def __init__(self, function, once=False, daemon=False, *args, **kwargs):
+    def __init__(self, function, once=False, daemon=False, *args, on_stop=None, **kwargs):
         super(WorkerThread, self).__init__(daemon=daemon)
         self.stop = False
         self.my_args = args
         self.my_kwargs = kwargs
         self.my_func = function
         self.once = once
+        # Called with this thread once it has finished running.
+        self.on_stop = on_stop
 
     def run(self):
         if self.stop:
             return
 
-        self.my_func(*self.my_args, **self.my_kwargs)
-        if self.once:
-            self.stop = True
+        try:
+            self.my_func(*self.my_args, **self.my_kwargs)
+        finally:
+            if self.once:
+                self.stop = True
+            if self.on_stop is not None:
+                self.on_stop(self)